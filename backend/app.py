@@ -1,36 +1,74 @@
 from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request
-from fastapi.responses import JSONResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 import os
-import json
+import time
+import uuid
+import atexit
+import queue
+import asyncio
+import multiprocessing
+import anyio.to_thread
 import logging
 import traceback
+from logging.handlers import QueueHandler, QueueListener
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
 from datetime import datetime
+from functools import lru_cache
 from typing import Optional
-from pydantic import BaseModel
-from src.audio_transcriber import AudioTranscriber
+from pydantic import BaseModel, Field
+from faster_whisper import download_model
+from src.audio_transcriber import default_num_threads, init_transcription_worker, transcribe_and_save
 from difflib import SequenceMatcher
 
+from src.notes_store import NotesStore
 from src.transcription_data import TranscriptionData
 
 # Configure logging
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+
+# Records are formatted by the QueueHandler and written to the file and
+# console by a background listener thread, so requests never block on log I/O
+log_queue = queue.SimpleQueue()
+log_listener = QueueListener(
+    log_queue,
+    logging.FileHandler('app.log'),
+    logging.StreamHandler()
+)
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=LOG_LEVEL,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('app.log'),
-        logging.StreamHandler()
-    ]
+    handlers=[QueueHandler(log_queue)]
 )
+log_listener.start()
+atexit.register(log_listener.stop)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Audio Transcription API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global notes_store
+    # Sync endpoints run in anyio's default threadpool (40 threads by default)
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    logger.info(f"Threadpool size set to {THREADPOOL_SIZE}")
+    notes_store = NotesStore(NOTES_PATH)
+    await start_transcription_executor()
+    try:
+        yield
+    finally:
+        stop_transcription_executor()
+        notes_store.close()
+
+app = FastAPI(title="Audio Transcription API", lifespan=lifespan)
 
-# Configure CORS
+# Configure CORS; CORS_ALLOW_ORIGINS takes a comma separated list of
+# origins, an explicit list avoids the wildcard matching path
+CORS_ALLOW_ORIGINS = os.environ.get("CORS_ALLOW_ORIGINS", "*").split(",")
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=CORS_ALLOW_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -38,20 +76,91 @@ app.add_middleware(
 
 # Constants and initialization
 UPLOAD_FOLDER = 'uploads'
+# Uploads are streamed here and only linked into UPLOAD_FOLDER once
+# complete; it lives inside UPLOAD_FOLDER so both are on the same filesystem
+UPLOAD_TMP_NAME = '.incoming'
+UPLOAD_TMP_FOLDER = os.path.join(UPLOAD_FOLDER, UPLOAD_TMP_NAME)
+NOTES_PATH = 'notes/notes.json'
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB per read/write when streaming uploads to disk
+THREADPOOL_SIZE = 100  # Worker threads available to sync (file I/O bound) endpoints
+DOWNLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB per send when serving uploaded files
+# Uploaded audio is published complete and never rewritten, so clients may
+# cache it for good; transcription files can be regenerated and are revalidated
+UPLOADS_CACHE_CONTROL = "public, max-age=31536000, immutable"
+TRANSCRIPTION_CACHE_CONTROL = "no-cache"
+TRANSCRIPTION_SUFFIXES = (".txt", ".words.npz", ".words.json", ".timing.json")
+MODEL_SIZE = "tiny"
+MODELS_DIR = "./.models"
+TRANSCRIPTION_WORKERS = int(os.environ.get("TRANSCRIPTION_WORKERS", "1"))
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
     logger.info(f"Created upload directory at {UPLOAD_FOLDER}")
+os.makedirs(UPLOAD_TMP_FOLDER, exist_ok=True)
+
+def uploads_cache_control(path: str) -> str:
+    """Cache-Control for a file under UPLOAD_FOLDER"""
+    if path.endswith(TRANSCRIPTION_SUFFIXES):
+        return TRANSCRIPTION_CACHE_CONTROL
+    return UPLOADS_CACHE_CONTROL
+
+class UploadsStaticFiles(StaticFiles):
+    """StaticFiles serving uploads in large chunks with long-lived caching"""
+    def lookup_path(self, path):
+        # Uploads still being received are never served
+        if path.split(os.sep, 1)[0] == UPLOAD_TMP_NAME:
+            return "", None
+        return super().lookup_path(path)
+
+    def file_response(self, full_path, *args, **kwargs):
+        response = super().file_response(full_path, *args, **kwargs)
+        # StaticFiles builds a plain FileResponse (ETag/304 included), so
+        # only the chunk size and caching headers need adjusting
+        response.chunk_size = DOWNLOAD_CHUNK_SIZE
+        response.headers["Cache-Control"] = uploads_cache_control(str(full_path))
+        return response
 
 # Mount the uploads directory to serve files
-app.mount("/uploads", StaticFiles(directory=UPLOAD_FOLDER), name="uploads")
+app.mount("/uploads", UploadsStaticFiles(directory=UPLOAD_FOLDER), name="uploads")
+
+# Opened and closed by the lifespan handler
+notes_store: Optional[NotesStore] = None
+
+# Transcription runs in separate processes so CPU-bound whisper inference
+# never blocks the event loop; each worker loads its own model on start
+transcription_executor: Optional[ProcessPoolExecutor] = None
+transcription_model_path: Optional[str] = None
+
+def create_transcription_executor() -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(
+        max_workers=TRANSCRIPTION_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_transcription_worker,
+        # Workers share the cores instead of each one using all of them
+        initargs=(transcription_model_path, default_num_threads(TRANSCRIPTION_WORKERS))
+    )
 
-# Initialize transcriber
-try:
-    transcriber = AudioTranscriber(model_size="tiny")
-    logger.info("AudioTranscriber initialized successfully")
-except Exception as e:
-    logger.error(f"Failed to initialize AudioTranscriber: {str(e)}\n{traceback.format_exc()}")
-    raise
+async def start_transcription_executor():
+    global transcription_executor, transcription_model_path
+    # Resolve the model files once here so every worker loads them from a
+    # local path instead of each one checking or downloading from the hub
+    transcription_model_path = await run_in_threadpool(download_model, MODEL_SIZE, cache_dir=MODELS_DIR)
+    transcription_executor = create_transcription_executor()
+    logger.info(f"Transcription pool started with {TRANSCRIPTION_WORKERS} worker(s)")
+
+def restart_transcription_executor(broken_executor: ProcessPoolExecutor):
+    """Replace a pool that lost a worker; a broken pool rejects all new work"""
+    global transcription_executor
+    # Requests that failed on the same broken pool only replace it once
+    if transcription_executor is not broken_executor:
+        return
+    broken_executor.shutdown(wait=False, cancel_futures=True)
+    transcription_executor = create_transcription_executor()
+    logger.warning("Transcription pool restarted after a worker died")
+
+def stop_transcription_executor():
+    if transcription_executor is not None:
+        transcription_executor.shutdown(cancel_futures=True)
+        logger.info("Transcription pool stopped")
 
 # Response models
 class UploadResponse(BaseModel):
@@ -70,6 +179,8 @@ class ContextResponse(BaseModel):
 class TimestampRequest(BaseModel):
     timestamp: float
     fileName: str
+    # Only return the last context_chars characters of the context when set
+    context_chars: Optional[int] = Field(default=None, gt=0)
 
 class TimestampsByTextRequest(BaseModel):
     context_text: str
@@ -104,6 +215,12 @@ def find_text_position(full_text: str, search_text: str) -> tuple[int, int]:
     clean_full = full_text.strip().lower()
     clean_search = search_text.strip().lower()
     
+    # Exact matches are the common case; str.find is far cheaper than
+    # running SequenceMatcher over the whole transcript
+    start_char = clean_full.find(clean_search)
+    if start_char != -1:
+        return start_char, start_char + len(clean_search)
+    
     # Find best matching substring
     matcher = SequenceMatcher(None, clean_full, clean_search)
     match = matcher.find_longest_match(0, len(clean_full), 0, len(clean_search))
@@ -117,21 +234,33 @@ def find_text_position(full_text: str, search_text: str) -> tuple[int, int]:
     
     return start_char, end_char
 
+@lru_cache(maxsize=64)
+def get_transcription_data(file_path: str) -> TranscriptionData:
+    """
+    Load transcription data for file_path, caching the parsed result.
+    Transcriptions are immutable once saved; the cache is cleared whenever
+    a new transcription is written.
+    """
+    return TranscriptionData.load(file_path)
+
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    start_time = datetime.now()
+    start_time = time.perf_counter()
     response = None
     
     # Log request details
-    logger.info(f"Request started: {request.method} {request.url}")
-    logger.debug(f"Headers: {dict(request.headers)}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Request started: %s %s", request.method, request.url)
+        logger.debug("Headers: %s", dict(request.headers))
     
     try:
         response = await call_next(request)
         
-        # Log response details
-        process_time = (datetime.now() - start_time).total_seconds()
-        logger.info(f"Request completed: {request.method} {request.url} - Status: {response.status_code} - Time: {process_time}s")
+        # Log response details; successful requests only at DEBUG level
+        level = logging.DEBUG if response.status_code < 400 else logging.INFO
+        if logger.isEnabledFor(level):
+            process_time = time.perf_counter() - start_time
+            logger.log(level, "Request completed: %s %s - Status: %s - Time: %.4fs", request.method, request.url, response.status_code, process_time)
         
         return response
     except Exception as e:
@@ -139,12 +268,12 @@ async def log_requests(request: Request, call_next):
         raise
     finally:
         if response is None:
-            process_time = (datetime.now() - start_time).total_seconds()
+            process_time = time.perf_counter() - start_time
             logger.error(f"Request failed to complete: {request.method} {request.url} - Time: {process_time}s")
 
 @app.post("/upload", response_model=UploadResponse)
 async def upload_file(file: UploadFile = File(...), file_type: Optional[str] = Form("unknown")):
-    logger.info(f"Processing upload request for file: {file.filename}")
+    logger.info("Processing upload request for file: %s", file.filename)
 
     if not file:
         logger.warning("Upload request received with no file")
@@ -153,33 +282,55 @@ async def upload_file(file: UploadFile = File(...), file_type: Optional[str] = F
     filename = file.filename
     filepath = os.path.join(UPLOAD_FOLDER, filename)
 
-    if os.path.exists(filepath):
-        logger.warning(f"File already exists: {filepath}")
+    tmp_path = None
+    try:
+        if os.path.exists(filepath):
+            raise FileExistsError(filepath)
+        # The upload is streamed in fixed-size chunks so memory stays
+        # bounded regardless of the audio file size. It is written under a
+        # temporary name, so a partial file is never served or cached
+        # Created with mode 0666 like a plain open(), so the umask decides
+        # the permissions of the published file
+        tmp_path = os.path.join(UPLOAD_TMP_FOLDER, uuid.uuid4().hex)
+        tmp_fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        with open(tmp_fd, "wb", buffering=UPLOAD_CHUNK_SIZE) as f:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                await run_in_threadpool(f.write, chunk)
+        # Linking publishes the complete file atomically and, unlike a
+        # rename, fails if another upload took the name meanwhile
+        os.link(tmp_path, filepath)
+        logger.info("File saved successfully at: %s", filepath)
+    except FileExistsError:
+        logger.warning("File already exists: %s", filepath)
         return UploadResponse(
             message="File already exists",
             filename=filename,
             file_type=file_type
         )
-
-    try:
-        contents = await file.read()
-        with open(filepath, "wb") as f:
-            f.write(contents)
-        logger.info(f"File saved successfully at: {filepath}")
     except Exception as e:
         error_msg = f"Failed to save file: {str(e)}"
         logger.error(f"{error_msg}\n{traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=error_msg)
+    finally:
+        if tmp_path is not None:
+            os.remove(tmp_path)
 
     # Process the file
     try:
-        logger.info(f"Starting transcription for file: {filename}")
-        context_data = transcriber.transcribe(filepath)
-        logger.info(f"Transcription completed for file: {filename}")
-
-        context_data.save(filepath)
-        logger.info(f"Transcription results saved")
-
+        logger.info("Starting transcription for file: %s", filename)
+        loop = asyncio.get_running_loop()
+        executor = transcription_executor
+        await loop.run_in_executor(executor, transcribe_and_save, filepath, filepath)
+        get_transcription_data.cache_clear()
+        logger.info("Transcription completed and saved for file: %s", filename)
+
+    except BrokenProcessPool as e:
+        # The worker died (native crash, OOM kill); fail only this upload
+        # and give later ones a fresh pool
+        restart_transcription_executor(executor)
+        error_msg = f"Transcription failed: {str(e)}"
+        logger.error(f"{error_msg}\n{traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail=error_msg)
     except Exception as e:
         error_msg = f"Transcription failed: {str(e)}"
         logger.error(f"{error_msg}\n{traceback.format_exc()}")
@@ -191,54 +342,56 @@ async def upload_file(file: UploadFile = File(...), file_type: Optional[str] = F
         file_type=file_type
     )
 
-@app.get("/files")
-async def list_files():
+@app.get("/files", response_model=list[str])
+def list_files():
     logger.info("Processing request to list files")
     try:
-        files = os.listdir(UPLOAD_FOLDER)
-        logger.debug(f"Files found: {files}")
-        return JSONResponse(content=files)
+        files = [name for name in os.listdir(UPLOAD_FOLDER) if name != UPLOAD_TMP_NAME]
+        logger.debug("Files found: %s", files)
+        return files
     except Exception as e:
         error_msg = str(e)
         logger.error(f"Failed to list files: {error_msg}\n{traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=error_msg)
 
-@app.get("/uploads/{filename}")
-async def get_file(filename: str):
-    logger.info(f"Processing request to get file: {filename}")
-    filepath = os.path.join(UPLOAD_FOLDER, filename)
-    if not os.path.exists(filepath):
-        logger.warning(f"File not found: {filepath}")
-        raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(filepath)
-
 @app.get("/status/{filename}", response_model=StatusResponse)
-async def get_processing_status(filename: str):
-    logger.info(f"Checking processing status for file: {filename}")
+def get_processing_status(filename: str):
+    logger.info("Checking processing status for file: %s", filename)
     
     txt_path = os.path.join(UPLOAD_FOLDER, filename + '.txt')
     file_path = os.path.join(UPLOAD_FOLDER, filename)
     
-    if os.path.exists(txt_path):
-        logger.debug(f"Processing completed for file: {filename}")
+    try:
+        os.stat(txt_path)
+        logger.debug("Processing completed for file: %s", filename)
         return StatusResponse(status="completed")
+    except FileNotFoundError:
+        pass
     
-    if os.path.exists(file_path):
-        logger.debug(f"Processing in progress for file: {filename}")
+    try:
+        os.stat(file_path)
+        logger.debug("Processing in progress for file: %s", filename)
         return StatusResponse(status="processing")
-    
-    logger.warning(f"File not found: {filename}")
-    raise HTTPException(status_code=404, detail="File not found")
+    except FileNotFoundError:
+        logger.warning("File not found: %s", filename)
+        raise HTTPException(status_code=404, detail="File not found")
 
 @app.post("/api/context", response_model=ContextResponse)
-async def get_context(request: TimestampRequest):
-    logger.info(f"Getting context for timestamp {request.timestamp} in file {request.fileName}")
+def get_context(request: TimestampRequest):
+    logger.info("Getting context for timestamp %s in file %s", request.timestamp, request.fileName)
     
     try:
         file_path = os.path.join(UPLOAD_FOLDER, request.fileName)
-        context_data = TranscriptionData.load(file_path)
+        context_data = get_transcription_data(file_path)
+
+        text_at_second = context_data.get_text_at_second(
+            int(request.timestamp), max_context_chars=request.context_chars
+        )
+        if text_at_second is None:
+            # Nothing has been spoken yet at this timestamp
+            return ContextResponse(context="", start_position=0, end_position=0)
 
-        start_char, end_char, context = context_data.get_text_at_second(int(request.timestamp))
+        start_char, end_char, context = text_at_second
 
         return ContextResponse(
             context=context,
@@ -246,27 +399,24 @@ async def get_context(request: TimestampRequest):
             end_position=end_char
         )
         
+    except FileNotFoundError:
+        logger.warning("Transcription files not found for %s", request.fileName)
+        raise HTTPException(
+            status_code=404, 
+            detail="Transcription not found for this file"
+        )
     except Exception as e:
         error_msg = f"Failed to get context: {str(e)}"
         logger.error(f"{error_msg}\n{traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=error_msg)
 
 @app.post("/api/timestamps", response_model=TimestampResponse)
-async def get_timestamps_for_text(request: TimestampsByTextRequest):
-    logger.info(f"Getting timestamps for text segment in file {request.file_name}")
+def get_timestamps_for_text(request: TimestampsByTextRequest):
+    logger.info("Getting timestamps for text segment in file %s", request.file_name)
     
     try:
         file_path = os.path.join(UPLOAD_FOLDER, request.file_name)
-        
-        # Check if files exist
-        if not os.path.exists(file_path):
-            logger.warning(f"Transcription files not found for {request.file_name}")
-            raise HTTPException(
-                status_code=404, 
-                detail="Transcription not found for this file"
-            )
-
-        context_data = TranscriptionData.load(file_path)
+        context_data = get_transcription_data(file_path)
         frame = context_data.find_timeframe(request.context_text)
         
         return TimestampResponse(
@@ -274,16 +424,20 @@ async def get_timestamps_for_text(request: TimestampsByTextRequest):
             end_time=frame.end_time
         )
         
-    except HTTPException:
-        raise
+    except FileNotFoundError:
+        logger.warning("Transcription files not found for %s", request.file_name)
+        raise HTTPException(
+            status_code=404, 
+            detail="Transcription not found for this file"
+        )
     except Exception as e:
         error_msg = f"Failed to get timestamps: {str(e)}"
         logger.error(f"{error_msg}\n{traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=error_msg)
 
-@app.post("/api/add_note")
-async def add_note(request: NoteRequest):
-    logger.info(f"Adding note: {request.note}")
+@app.post("/api/add_note", response_model=NotePostResponse)
+def add_note(request: NoteRequest):
+    logger.info("Adding note: %s", request.note)
     try:
         note = {
             'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
@@ -291,9 +445,7 @@ async def add_note(request: NoteRequest):
             'note': request.note
         }
 
-        with open('notes/notes.json', 'a') as f:
-            json.dump(note, f)
-            f.write('\n')
+        notes_store.add(note)
     except Exception as e:
         error_msg = f"Failed to add note: {str(e)}"
         logger.error(f"{error_msg}\n{traceback.format_exc()}")
@@ -302,12 +454,10 @@ async def add_note(request: NoteRequest):
     return NotePostResponse(message="Note added successfully to notes.json")
 
 @app.get("/api/get_notes", response_model=NoteResponse)
-async def get_notes():
+def get_notes():
     logger.info("Getting notes")
     try:
-        with open('notes/notes.json', 'r') as f:
-            notes = [json.loads(line) for line in f]
-        return NoteResponse(notes=notes)
+        return NoteResponse(notes=notes_store.get_all())
     except Exception as e:
         error_msg = f"Failed to get notes: {str(e)}"
         logger.error(f"{error_msg}\n{traceback.format_exc()}")
@@ -316,4 +466,4 @@ async def get_notes():
 if __name__ == "__main__":
     import uvicorn
     logger.info("Starting server...")
-    uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True, log_level="debug")
\ No newline at end of file
+    uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True, log_level=LOG_LEVEL.lower())
\ No newline at end of file
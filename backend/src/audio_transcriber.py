@@ -1,21 +1,94 @@
-import math
 import os
-import json
-from dataclasses import asdict
-from typing import Dict, Tuple, List, Optional
+import queue
+import threading
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, TypeVar
 
-from faster_whisper import WhisperModel
-from .entities import WordPosition
+import numpy as np
+from faster_whisper import BatchedInferencePipeline, WhisperModel, decode_audio
 from .transcription_data import TranscriptionData
 
+T = TypeVar("T")
+
+# Marks the end of the producer's iterable in the prefetch queue
+_DONE = object()
+# How often a producer blocked on a full prefetch queue checks for a stop
+PREFETCH_POLL_SECONDS = 0.1
+
+
+def default_num_threads(num_workers: int = 1) -> int:
+    """
+    CPU threads for inference in each of num_workers concurrent
+    transcribers: WHISPER_NUM_THREADS, else all cores but one split
+    evenly between the workers.
+    """
+    if "WHISPER_NUM_THREADS" in os.environ:
+        return int(os.environ["WHISPER_NUM_THREADS"])
+    return max(1, ((os.cpu_count() or 1) - 1) // num_workers)
+
+
+def prefetch(iterable: Iterable[T], maxsize: int = 8) -> Iterator[T]:
+    """
+    Iterate iterable on a background thread, up to maxsize items ahead.
+    Lets the consumer's Python work overlap with a generator that spends
+    its time in native code with the GIL released (whisper inference).
+    Exceptions raised by the iterable are re-raised in the consumer, and
+    the producer stops once the consumer stops iterating.
+    """
+    items: queue.Queue = queue.Queue(maxsize=maxsize)
+    stopped = threading.Event()
+
+    def put(item) -> bool:
+        # Wait for room in bounded steps so an abandoned producer notices
+        # the stop and releases the iterable instead of blocking forever
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=PREFETCH_POLL_SECONDS)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except BaseException as e:
+            put(e)
+        else:
+            put(_DONE)
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while (item := items.get()) is not _DONE:
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stopped.set()
+
+
 class AudioTranscriber:
     def __init__(self, 
         model_size: str = "tiny",
-        compute_type: str = "int8",
-        num_threads: int = 4,
-        download_root: str = "./.models"
+        compute_type: str = "auto",
+        num_threads: Optional[int] = None,
+        download_root: str = "./.models",
+        batch_size: int = 8,
+        beam_size: int = 5,
+        flash_attention: bool = False
     ):
+        """
+        compute_type "auto" lets CTranslate2 pick the fastest type the CPU
+        supports (int8 on any x86 with AVX2/AVX-512/VNNI kernels).
+        flash_attention is only supported by CTranslate2 on CUDA devices.
+        """
         os.makedirs(download_root, exist_ok=True)
+        if num_threads is None:
+            num_threads = default_num_threads()
+        self.batch_size = batch_size
+        self.beam_size = beam_size
 
         print(f"Loading whisper.cpp model: {model_size}")
         self.model = WhisperModel(
@@ -23,9 +96,12 @@ class AudioTranscriber:
             device="cpu",
             compute_type=compute_type,
             cpu_threads=num_threads,
-            download_root=download_root
+            download_root=download_root,
+            flash_attention=flash_attention
         )
-        print("Model loaded successfully")
+        # Batched inference decodes several 30s windows in one model call
+        self.pipeline = BatchedInferencePipeline(model=self.model)
+        print(f"Model loaded successfully ({num_threads} threads, batch size {batch_size})")
 
     def transcribe(self, audio_path: str, save_path: Optional[str] = None) -> TranscriptionData:
         """
@@ -34,58 +110,77 @@ class AudioTranscriber:
         """
         print(f"Starting transcription of: {audio_path}")
 
-        segments, _ = self.model.transcribe(
-            audio_path,
+        # Decode and resample to mono 16 kHz float32 once, in-process, and
+        # hand the samples straight to the model
+        audio = decode_audio(audio_path, sampling_rate=self.model.feature_extractor.sampling_rate)
+        print(f"Decoded {len(audio) / self.model.feature_extractor.sampling_rate:.1f}s of audio")
+
+        options = dict(
             word_timestamps=True,
             language="en",
+            beam_size=self.beam_size,
             vad_filter=True,
             vad_parameters=dict(min_silence_duration_ms=500)
         )
+        if self.batch_size > 1:
+            segments, _ = self.pipeline.transcribe(audio, batch_size=self.batch_size, **options)
+        else:
+            segments, _ = self.model.transcribe(audio, **options)
         
-        full_text = ""
-        word_positions = []
-        char_to_second = {}
+        text_parts: List[str] = []
+        # Word fields are collected straight into typed arrays (compact,
+        # amortised growth) rather than as per-word WordPosition objects
+        start_chars = array("i")
+        end_chars = array("i")
+        start_times = array("d")
+        end_times = array("d")
+        word_ids = array("i")
+        vocabulary: Dict[str, int] = {}
         current_position = 0
         
-        for segment in segments:
+        # Bound methods are looked up once here rather than on every word
+        append_text = text_parts.append
+        append_start_char = start_chars.append
+        append_end_char = end_chars.append
+        append_start_time = start_times.append
+        append_end_time = end_times.append
+        append_word_id = word_ids.append
+        word_id_for = vocabulary.setdefault
+        
+        # Whisper decodes the next segments while this loop runs
+        for segment in prefetch(segments):
             for word in segment.words:
                 word_text = word.word
-                has_leading_space = word_text.startswith(" ")
                 clean_word = word_text.strip()
-                start_second = math.floor(word.start)
                 
-                if not has_leading_space and current_position > 0:
-                    full_text += " "
-                    char_to_second[current_position] = start_second
+                # Words are separated by a single space; a leading space
+                # on the very first word is kept as well
+                if current_position > 0 or word_text[:1] == " ":
+                    append_text(" ")
                     current_position += 1
-                elif has_leading_space:
-                    full_text += " "
-                    char_to_second[current_position] = start_second
-                    current_position += 1
-                
-                start_pos = current_position
-                end_pos = start_pos + len(clean_word)
                 
-                for char_pos in range(start_pos, end_pos):
-                    char_to_second[char_pos] = start_second
+                end_pos = current_position + len(clean_word)
                 
-                word_positions.append(WordPosition(
-                    start_char=start_pos,
-                    end_char=end_pos,
-                    start_time=word.start,
-                    end_time=word.end,
-                    word=clean_word
-                ))
+                append_start_char(current_position)
+                append_end_char(end_pos)
+                append_start_time(word.start)
+                append_end_time(word.end)
+                append_word_id(word_id_for(clean_word, len(vocabulary)))
                 
-                full_text += clean_word
+                append_text(clean_word)
                 current_position = end_pos
         
+        full_text = "".join(text_parts)
         print(f"Transcription completed. Text length: {len(full_text)}")
         
         transcription_data = TranscriptionData(
             text=full_text,
-            word_positions=word_positions,
-            char_to_second=char_to_second
+            start_chars=np.array(start_chars, dtype=np.int32),
+            end_chars=np.array(end_chars, dtype=np.int32),
+            start_times=np.array(start_times, dtype=np.float64),
+            end_times=np.array(end_times, dtype=np.float64),
+            word_ids=np.array(word_ids, dtype=np.int32),
+            vocabulary=list(vocabulary)
         )
         
         if save_path:
@@ -94,6 +189,25 @@ class AudioTranscriber:
         return transcription_data
 
 
+# Transcriber owned by the current worker process of a transcription pool
+_worker_transcriber: Optional[AudioTranscriber] = None
+
+
+def init_transcription_worker(model_size_or_path: str, num_threads: Optional[int] = None):
+    """Process pool initializer: load the whisper model once per worker"""
+    global _worker_transcriber
+    _worker_transcriber = AudioTranscriber(model_size=model_size_or_path, num_threads=num_threads)
+
+
+def transcribe_and_save(audio_path: str, save_path: str):
+    """
+    Transcribe audio_path inside a pool worker and save the results.
+    Only the file paths cross the process boundary, the transcription
+    itself is written to disk by the worker.
+    """
+    _worker_transcriber.transcribe(audio_path, save_path)
+
+
 # Example usage:
 if __name__ == "__main__":
     transcriber = AudioTranscriber(
@@ -1,15 +1,19 @@
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class TimeFrame:
     start_time: float
     end_time: float
     text: str
 
     def to_dict(self):
-        return asdict(self)
+        return {
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "text": self.text
+        }
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class WordPosition:
     start_char: int
     end_char: int
@@ -18,4 +22,10 @@ class WordPosition:
     word: str
 
     def to_dict(self):
-        return asdict(self)
+        return {
+            "start_char": self.start_char,
+            "end_char": self.end_char,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "word": self.word
+        }
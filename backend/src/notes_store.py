@@ -0,0 +1,56 @@
+import os
+import threading
+from typing import Dict, List
+
+import orjson
+
+
+class NotesStore:
+    """
+    Append-only JSON lines storage for notes.
+    The file is opened once for appending. Parsed notes are cached and only
+    the lines appended since the last read are parsed, so notes written by
+    other processes are still picked up without re-reading the whole file.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._notes: List[Dict] = []
+        # Identity of the file the cached notes came from and how many of
+        # its bytes have been parsed
+        self._inode = None
+        self._offset = 0
+        self._file = open(path, "ab")
+
+    def _refresh(self):
+        """Parse lines appended to the file since the last refresh"""
+        stat = os.stat(self.path)
+        if stat.st_ino != self._inode or stat.st_size < self._offset:
+            # The file was replaced or truncated, start over
+            self._notes, self._inode, self._offset = [], stat.st_ino, 0
+        if stat.st_size == self._offset:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read(stat.st_size - self._offset)
+        # A line still being written by another process is left for later
+        end = data.rfind(b"\n") + 1
+        self._notes.extend(orjson.loads(line) for line in data[:end].splitlines() if line.strip())
+        self._offset += end
+
+    def add(self, note: Dict):
+        """Append a note to the file"""
+        line = orjson.dumps(note) + b"\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def get_all(self) -> List[Dict]:
+        """Return all notes in insertion order"""
+        with self._lock:
+            self._refresh()
+            return list(self._notes)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
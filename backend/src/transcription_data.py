@@ -1,80 +1,281 @@
-import math
+import mmap
 import os
-import json
-from dataclasses import asdict
-from typing import Dict, List, Optional
+import uuid
+import numpy as np
+import orjson
+from typing import Dict, List, Optional, Tuple
 
 from .entities import WordPosition, TimeFrame
 
 
+def _create_temp_file(path: str) -> Tuple[int, str]:
+    """
+    Create a uniquely named file next to path, to be moved onto it once
+    written. Mode 0666 lets the umask set its permissions, as open() does.
+    """
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    return os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666), tmp_path
+
+
 class TranscriptionData:
     def __init__(self, 
-        text: str,
-        word_positions: List[WordPosition],
-        char_to_second: Dict[int, int]
+        text: Optional[str],
+        start_chars: np.ndarray,
+        end_chars: np.ndarray,
+        start_times: np.ndarray,
+        end_times: np.ndarray,
+        word_ids: np.ndarray,
+        vocabulary: List[str],
+        text_buffer: Optional[mmap.mmap] = None,
+        text_length: Optional[int] = None
     ):
-        self.text = text
-        self.word_positions = word_positions
-        self.char_to_second = char_to_second
+        """
+        Words are stored column-wise: word i spans
+        text[start_chars[i]:end_chars[i]], is spoken from start_times[i] to
+        end_times[i] and reads vocabulary[word_ids[i]].
+        text may be None when text_buffer (a read-only mmap of the saved
+        .txt file) and text_length (its length in characters) are given;
+        it is then decoded on first access.
+        """
+        self._text = text
+        self._text_buffer = text_buffer
+        self._text_length = len(text) if text is not None else text_length
+        # For pure ASCII transcripts byte offsets equal char offsets, so
+        # slices can be decoded straight from the mapped file. UTF-8 text is
+        # ASCII exactly when its byte length equals its character length
+        self._text_buffer_is_ascii = (
+            text_buffer is not None and len(text_buffer) == self._text_length
+        )
+        # Words are emitted in time and text order, so these are all sorted
+        self._start_chars = np.asarray(start_chars, dtype=np.int32)
+        self._end_chars = np.asarray(end_chars, dtype=np.int32)
+        self._start_times = np.asarray(start_times, dtype=np.float64)
+        self._end_times = np.asarray(end_times, dtype=np.float64)
+        self._word_ids = np.asarray(word_ids, dtype=np.int32)
+        self._vocabulary = vocabulary
+        # Interval index over the whole seconds during which each word is
+        # spoken. Ends are made non-decreasing with a running max so both
+        # bounds can be binary searched even if word timings overlap
+        self._floor_starts = np.floor(self._start_times).astype(np.int32)
+        self._ceil_ends = np.maximum.accumulate(np.ceil(self._end_times).astype(np.int32))
+        self._word_positions: Optional[List[WordPosition]] = None
+        self._char_to_second: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_word_positions(cls,
+        text: str,
+        word_positions: List[WordPosition]
+    ) -> "TranscriptionData":
+        """Build transcription data from a list of WordPosition objects"""
+        vocabulary: Dict[str, int] = {}
+        word_ids = [vocabulary.setdefault(wp.word, len(vocabulary)) for wp in word_positions]
+        data = cls(
+            text,
+            start_chars=np.array([wp.start_char for wp in word_positions], dtype=np.int32),
+            end_chars=np.array([wp.end_char for wp in word_positions], dtype=np.int32),
+            start_times=np.array([wp.start_time for wp in word_positions], dtype=np.float64),
+            end_times=np.array([wp.end_time for wp in word_positions], dtype=np.float64),
+            word_ids=np.array(word_ids, dtype=np.int32),
+            vocabulary=list(vocabulary)
+        )
+        data._word_positions = word_positions
+        return data
+
+    @property
+    def word_positions(self) -> List[WordPosition]:
+        """WordPosition objects for all words, built on first access"""
+        if self._word_positions is None:
+            vocabulary = self._vocabulary
+            self._word_positions = [
+                WordPosition(start_char, end_char, start_time, end_time, vocabulary[word_id])
+                for start_char, end_char, start_time, end_time, word_id in zip(
+                    self._start_chars.tolist(),
+                    self._end_chars.tolist(),
+                    self._start_times.tolist(),
+                    self._end_times.tolist(),
+                    self._word_ids.tolist(),
+                )
+            ]
+        return self._word_positions
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            # Decode straight from the mapping, without a bytes copy first
+            self._text = str(self._text_buffer, "utf-8")
+        return self._text
+
+    def _slice_text(self, start: int, end: int) -> str:
+        """Return text[start:end] without decoding the whole file if possible"""
+        if self._text is None and self._text_buffer_is_ascii:
+            with memoryview(self._text_buffer) as view:
+                return str(view[start:end], "ascii")
+        return self.text[start:end]
+
+    def _find_text(self, search_text: str) -> int:
+        """Return the char offset of search_text in the text, or -1"""
+        if self._text is None and self._text_buffer_is_ascii:
+            # Search the mapped bytes directly rather than decoding the
+            # whole transcript; a non-ASCII needle can't match ASCII text
+            if not search_text.isascii():
+                return -1
+            return self._text_buffer.find(search_text.encode("ascii"))
+        return self.text.find(search_text)
 
     def save(self, base_path: str):
         """Save transcription data to files"""
         # Create directory if it doesn't exist
         os.makedirs(os.path.dirname(base_path), exist_ok=True)
         
-        # Save full text
-        with open(f"{base_path}.txt", "w", encoding="utf-8") as f:
-            f.write(self.text)
-            
-        # Save word positions
-        word_positions_data = [asdict(wp) for wp in self.word_positions]
-        with open(f"{base_path}.words.json", "w", encoding="utf-8") as f:
-            json.dump(word_positions_data, f, indent=2)
+        # Save full text; mapped text is written back as-is, not decoded
+        # and re-encoded. The new file is moved into place rather than
+        # truncating the old one, which may be the file that is mapped
+        tmp_fd, tmp_path = _create_temp_file(f"{base_path}.txt")
+        with open(tmp_fd, "wb") as f:
+            if self._text is None:
+                f.write(self._text_buffer)
+            else:
+                f.write(self._text.encode("utf-8"))
+        os.replace(tmp_path, f"{base_path}.txt")
             
-        # Save char to second mapping
-        with open(f"{base_path}.timing.json", "w", encoding="utf-8") as f:
-            json.dump(self.char_to_second, f, indent=2)
+        self._save_words(base_path)
+
+    def _save_words(self, base_path: str):
+        """Save word positions to the .words.npz file"""
+        # Save word positions as columnar arrays; the distinct words are
+        # packed into a single UTF-8 buffer indexed by offsets
+        encoded_words = [word.encode("utf-8") for word in self._vocabulary]
+        vocabulary_offsets = np.zeros(len(encoded_words) + 1, dtype=np.int64)
+        np.cumsum([len(word) for word in encoded_words], out=vocabulary_offsets[1:])
+        # Written under a unique temporary name and moved into place, so
+        # readers never see a partial file and concurrent writers don't mix
+        tmp_fd, tmp_path = _create_temp_file(f"{base_path}.words.npz")
+        with open(tmp_fd, "wb") as f:
+            np.savez(
+                f,
+                start_char=self._start_chars,
+                end_char=self._end_chars,
+                start_time=self._start_times,
+                end_time=self._end_times,
+                word_id=self._word_ids,
+                vocabulary=np.frombuffer(b"".join(encoded_words), dtype=np.uint8),
+                vocabulary_offsets=vocabulary_offsets,
+                text_length=self._text_length
+            )
+        os.replace(tmp_path, f"{base_path}.words.npz")
 
     @classmethod
     def load(cls, base_path: str) -> "TranscriptionData":
         """Load transcription data from files"""
-        # Load full text
-        with open(f"{base_path}.txt", "r", encoding="utf-8") as f:
-            text = f.read()
+        # Map the full text instead of reading it; pages are loaded on demand
+        text, text_buffer = None, None
+        with open(f"{base_path}.txt", "rb") as f:
+            if os.fstat(f.fileno()).st_size:
+                text_buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                # Empty files can't be mapped
+                text = ""
             
-        # Load word positions
-        with open(f"{base_path}.words.json", "r", encoding="utf-8") as f:
-            word_positions_data = json.load(f)
-            word_positions = [
-                WordPosition(**wp_dict) for wp_dict in word_positions_data
+        if not os.path.exists(f"{base_path}.words.npz"):
+            return cls._load_legacy(base_path, text_buffer)
+
+        # Load word positions; WordPosition objects are only built on demand
+        with np.load(f"{base_path}.words.npz") as words_data:
+            vocabulary_bytes = words_data["vocabulary"].tobytes()
+            offsets = words_data["vocabulary_offsets"].tolist()
+            vocabulary = [
+                vocabulary_bytes[start:end].decode("utf-8")
+                for start, end in zip(offsets, offsets[1:])
             ]
-            
-        # Load char to second mapping
-        with open(f"{base_path}.timing.json", "r", encoding="utf-8") as f:
-            char_to_second = {
-                int(k): v for k, v in json.load(f).items()
+            text_length = int(words_data["text_length"])
+            word_columns = {
+                "start_chars": words_data["start_char"],
+                "end_chars": words_data["end_char"],
+                "start_times": words_data["start_time"],
+                "end_times": words_data["end_time"],
+                "word_ids": words_data["word_id"],
             }
             
-        return cls(text, word_positions, char_to_second)
+        return cls(
+            text,
+            vocabulary=vocabulary,
+            text_buffer=text_buffer,
+            text_length=text_length,
+            **word_columns
+        )
+
+    @classmethod
+    def _load_legacy(cls,
+        base_path: str,
+        text_buffer: Optional[mmap.mmap]
+    ) -> "TranscriptionData":
+        """
+        Load a transcription saved as .words.json, either as a list of word
+        position dicts or column-wise, and convert it to .words.npz
+        """
+        with open(f"{base_path}.words.json", "rb") as f:
+            words_data = orjson.loads(f.read())
+        if isinstance(words_data, dict):
+            words = words_data["words"]
+            word_positions = [
+                WordPosition(start_char, end_char, start_time, end_time, words[word_id])
+                for start_char, end_char, start_time, end_time, word_id in zip(
+                    words_data["start_char"],
+                    words_data["end_char"],
+                    words_data["start_time"],
+                    words_data["end_time"],
+                    words_data["word_id"],
+                )
+            ]
+        else:
+            word_positions = [WordPosition(**wp_dict) for wp_dict in words_data]
+
+        text = str(text_buffer, "utf-8") if text_buffer is not None else ""
+        data = cls.from_word_positions(text, word_positions)
+        data._save_words(base_path)
+        return data
+
+    @property
+    def char_to_second(self) -> np.ndarray:
+        """
+        Dense per-character map of the second each character is spoken at.
+        Not stored; built on first access with a single vectorised repeat
+        of each word's start second over its span.
+        """
+        if self._char_to_second is None:
+            span_lengths = np.diff(self._end_chars, prepend=0)
+            self._char_to_second = np.repeat(self._floor_starts, span_lengths)
+        return self._char_to_second
+
+    def second_at_char(self, char_pos: int) -> Optional[int]:
+        """
+        Return the second at which the character at char_pos is spoken.
+        Each word owns the characters from the previous word's end up to
+        its own end, separator included.
+        """
+        index = int(np.searchsorted(self._end_chars, char_pos, side="right"))
+        if char_pos < 0 or index == len(self._end_chars):
+            return None
+        return int(self._floor_starts[index])
 
     def find_timeframe(self, search_text: str) -> Optional[TimeFrame]:
         """Find the timeframe for a given text in the transcription"""
-        start_idx = self.text.find(search_text)
+        start_idx = self._find_text(search_text)
         if start_idx == -1:
             return None
             
         end_idx = start_idx + len(search_text)
         
-        matching_words = [
-            wp for wp in self.word_positions 
-            if (wp.start_char <= end_idx and wp.end_char >= start_idx)
-        ]
+        # Words overlapping [start_idx, end_idx]: the first one ending at or
+        # after start_idx up to the last one starting at or before end_idx
+        lo = np.searchsorted(self._end_chars, start_idx, side="left")
+        hi = np.searchsorted(self._start_chars, end_idx, side="right")
         
-        if not matching_words:
+        if lo >= hi:
             return None
             
-        start_time = min(word.start_time for word in matching_words)
-        end_time = max(word.end_time for word in matching_words)
+        start_time = float(self._start_times[lo:hi].min())
+        end_time = float(self._end_times[lo:hi].max())
         
         return TimeFrame(
             start_time=start_time,
@@ -82,17 +283,26 @@ class TranscriptionData:
             text=search_text
         )
 
-    def get_text_at_second(self, second: int) -> Optional[str]:
-        """Find the text being spoken at a specific second"""
-        words_at_second = [
-            wp for wp in self.word_positions 
-            if (math.floor(wp.start_time) <= second <= math.ceil(wp.end_time))
-        ]
-        
-        if not words_at_second:
+    def get_text_at_second(
+        self, second: int, max_context_chars: Optional[int] = None
+    ) -> Optional[Tuple[int, int, str]]:
+        """
+        Find the text being spoken at a specific second.
+        During silence the last word spoken before that second is used.
+        Returns the word span and the text up to it, limited to the last
+        max_context_chars characters when given.
+        """
+        # Words spoken at that second start at or before it (index < hi)
+        # and end at or after it (index >= lo)
+        hi = int(np.searchsorted(self._floor_starts, second, side="right"))
+        if hi == 0:
             return None
-            
-        start_char = min(wp.start_char for wp in words_at_second)
-        end_char = max(wp.end_char for wp in words_at_second)
+        lo = int(np.searchsorted(self._ceil_ends, second, side="left"))
+        if lo >= hi:
+            lo = hi - 1
+        
+        start_char = int(self._start_chars[lo:hi].min())
+        end_char = int(self._end_chars[lo:hi].max())
 
-        return start_char, end_char, self.text[:end_char]
+        context_start = 0 if max_context_chars is None else max(0, end_char - max_context_chars)
+        return start_char, end_char, self._slice_text(context_start, end_char)